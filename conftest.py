@@ -1,4 +1,7 @@
 import sys, os
 
 here = os.path.abspath("sync_function")
-sys.path.insert(0, here)
\ No newline at end of file
+sys.path.insert(0, here)
+
+# The SSM client is created at import time and needs a region, even when it is never called
+os.environ.setdefault("AWS_DEFAULT_REGION", "eu-west-1")
@@ -0,0 +1,5 @@
+-- Indexes backing the sync window filter in fetch_attendance_records.
+-- The query ORs a range on clock_in with a range on clock_out, which MySQL
+-- resolves as an index_merge union of these two range scans.
+CREATE INDEX idx_apt_clock_in ON zkbiotime.att_payloadtimecard (clock_in);
+CREATE INDEX idx_apt_clock_out ON zkbiotime.att_payloadtimecard (clock_out);
@@ -1,11 +1,17 @@
 import json
 import logging
 import os
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 
 import pymysql
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import boto3
+from botocore.config import Config
 
 logger = logging.getLogger()
 # logger.setLevel(logging.DEBUG)
@@ -19,52 +25,110 @@ ZOHO_REFRESH_TOKEN = os.environ.get("ZOHO_REFRESH_TOKEN")
 ZOHO_CLIENT_ID = os.environ.get("ZOHO_CLIENT_ID")
 ZOHO_CLIENT_SECRET = os.environ.get("ZOHO_CLIENT_SECRET")
 
-# SSM Parameter Names
+# SSM Parameter Names (SecureString holding the access token and its expiry as JSON)
 ZOHO_TOKEN_SSM_KEY = "ZOHO_ACCESS_TOKEN"
-ZOHO_TOKEN_EXPIRY_SSM_KEY = "ZOHO_ACCESS_TOKEN_EXPIRY"
 
 # Zoho Endpoints and Config
 ZOHO_TOKEN_ENDPOINT = "https://accounts.zoho.eu/oauth/v2/token"
 ZOHO_BULK_IMPORT_ENDPOINT = "https://people.zoho.eu/people/api/attendance/bulkImport"
 ACCESS_TOKEN_GRACE_PERIOD = 300
+ZOHO_BULK_IMPORT_BATCH_SIZE = 100
+ZOHO_BULK_IMPORT_MAX_WORKERS = 8
+ZOHO_BULK_IMPORT_INITIAL_CONCURRENCY = 6
+ZOHO_CIRCUIT_BREAKER_THRESHOLD = 3
+ZOHO_MAX_RETRY_AFTER = 5
+# (connect, read) seconds for every Zoho call, so a stalled socket can't outlive the 15s function timeout
+ZOHO_HTTP_TIMEOUT = (2, 5)
+# Worst-case time a bulkImport wave can take; a wave is only started if this (plus any pause) still fits
+ZOHO_WAVE_TIME_BUDGET_MS = sum(ZOHO_HTTP_TIMEOUT) * 1000
 
 # Define Pakistan timezone as UTC+5
 PKT = timezone(timedelta(hours=5))
 
-ssm = boto3.client("ssm")
+# Keep the SSM connection alive across warm invocations and back off on throttling
+_BOTO_CFG = Config(
+    tcp_keepalive=True,
+    max_pool_connections=10,
+    retries={"max_attempts": 3, "mode": "adaptive"},
+    connect_timeout=2,
+    read_timeout=5,
+)
+
+ssm = boto3.client("ssm", config=_BOTO_CFG)
+
+# Shared HTTP session so warm invocations reuse the TLS connection to Zoho
+_session = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=2,
+    pool_maxsize=4,
+    max_retries=Retry(
+        total=2,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["POST"],
+        raise_on_status=False,
+        respect_retry_after_header=False,
+    ),
+)
+_session.mount("https://", _adapter)
+
+# bulkImport gets no transport-level retries: AIMD and the circuit breaker in send_to_zoho
+# are its only backoff, and Retry-After is capped there to fit the function timeout
+_bulk_import_adapter = HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=ZOHO_BULK_IMPORT_MAX_WORKERS,
+    max_retries=Retry(total=0, raise_on_status=False, respect_retry_after_header=False),
+)
+_session.mount(ZOHO_BULK_IMPORT_ENDPOINT, _bulk_import_adapter)
+
+# AIMD-controlled number of bulkImport batches in flight, kept across warm invocations
+_concurrency = ZOHO_BULK_IMPORT_INITIAL_CONCURRENCY
+
+# Worker threads for bulkImport batches, reused across warm invocations
+_executor = ThreadPoolExecutor(max_workers=ZOHO_BULK_IMPORT_MAX_WORKERS)
+
+# MySQL connection kept open across warm invocations
+_db_connection = None
+
+# Warm-container cache of the Zoho access token, populated from SSM or a refresh
+_TOKEN_CACHE = {"access_token": None, "expiry": None}
 
 
 def lambda_handler(event, context):
     # logger.info("Received event: %s", json.dumps(event))
     try:
-        logger.info("Calling fetch_attendance_records...")
-        records = fetch_attendance_records(DB_HOST, DB_USER, DB_PASSWORD, DB_NAME)
-        logger.info("Fetched %d records from database.", len(records))
-        
-        if records:
-            logger.info("First few records: %s", json.dumps(records[:5], default=str))
-        else:
-            logger.info("No records retrieved from the database.")
-
-        logger.info("Completed fetch_attendance_records successfully.")
-
-        if not records:
-            logger.info("No records found to send to Zoho.")
-            return success_response("No data to send.")
-
-        logger.info("Transforming records for Zoho...")
-        zoho_data = transform_records_for_zoho(records)
-        logger.info("Transformed Zoho data. Number of records: %d", len(zoho_data))
-        if zoho_data:
-            logger.info("Transformed records: %s", json.dumps(zoho_data))
-
-        logger.info("Retrieving or refreshing Zoho access token...")
-        access_token = get_or_refresh_zoho_access_token(ZOHO_REFRESH_TOKEN, ZOHO_CLIENT_ID, ZOHO_CLIENT_SECRET)
-        logger.info("Using access token: %s...", access_token[:10])
+        # The DB query and the token lookup are independent, so overlap their I/O
+        logger.info("Calling fetch_attendance_records and retrieving or refreshing Zoho access token...")
+        # A per-invocation pool, so a worker stuck past a function timeout can't hold a shared slot
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            records_future = executor.submit(fetch_attendance_records, DB_HOST, DB_USER, DB_PASSWORD, DB_NAME)
+            token_future = executor.submit(
+                get_or_refresh_zoho_access_token, ZOHO_REFRESH_TOKEN, ZOHO_CLIENT_ID, ZOHO_CLIENT_SECRET
+            )
+            zoho_data = records_future.result()
+            logger.info("Fetched and transformed %d records for Zoho.", len(zoho_data))
+            logger.info("Completed fetch_attendance_records successfully.")
+
+            if not zoho_data:
+                logger.info("No records found to send to Zoho.")
+                return success_response("No data to send.")
+
+            access_token = token_future.result()
+            logger.info("Using access token: %s...", access_token[:10])
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Transformed records: %s", json.dumps(zoho_data))
 
         logger.info("Sending data to Zoho...")
-        response = send_to_zoho(zoho_data, access_token)
-        logger.info("Zoho API response: %s", response)
+        response = send_to_zoho(zoho_data, access_token, context)
+        logger.debug("Zoho API response: %s", response)
+        failed = sum(1 for result in response if not is_successful_status(result["status_code"]))
+        if failed == len(response):
+            logger.error("All %d batches failed to send to Zoho.", failed)
+            return error_response("Failed to send data to Zoho", response)
+        if failed:
+            logger.error("%d of %d batches failed to send to Zoho.", failed, len(response))
+            return error_response(f"Data partially sent to Zoho: {failed} of {len(response)} batches failed", response)
         logger.info("Data sent to Zoho successfully.")
 
         return success_response("Data sent to Zoho successfully", response)
@@ -84,73 +148,107 @@ def fetch_attendance_records(db_host, db_user, db_password, db_name):
     end_time_str = end_time.strftime("%Y-%m-%d %H:%M:%S")
     logger.info("End time (PKT) is: %s", end_time_str)
 
-    query = f"""
-    SELECT *
-        FROM (
-            SELECT 
-                pe.emp_code AS employeeId,
-                DATE_FORMAT(apt.clock_in, '%Y-%m-%d %H:%i:%s') AS eventTime,
-                '1' AS isCheckin,
-                DATE_FORMAT(apt.clock_in, '%Y-%m-%d %H:%i:%s') AS downloadDate
-            FROM zkbiotime.att_payloadtimecard apt
-            JOIN zkbiotime.personnel_employee pe ON pe.id = apt.emp_id
-            WHERE apt.clock_in >= STR_TO_DATE('{start_time_str}', '%Y-%m-%d %H:%i:%s')
-            AND apt.clock_in < STR_TO_DATE('{end_time_str}', '%Y-%m-%d %H:%i:%s')
-            AND apt.clock_in IS NOT NULL
-
-            UNION ALL
-
-            SELECT 
-                pe.emp_code AS employeeId,
-                DATE_FORMAT(apt.clock_out, '%Y-%m-%d %H:%i:%s') AS eventTime,
-                '0' AS isCheckin,
-                DATE_FORMAT(apt.clock_out, '%Y-%m-%d %H:%i:%s') AS downloadDate
-            FROM zkbiotime.att_payloadtimecard apt
-            JOIN zkbiotime.personnel_employee pe ON pe.id = apt.emp_id
-            WHERE apt.clock_out >= STR_TO_DATE('{start_time_str}', '%Y-%m-%d %H:%i:%s')
-            AND apt.clock_out < STR_TO_DATE('{end_time_str}', '%Y-%m-%d %H:%i:%s')
-            AND apt.clock_out IS NOT NULL
-        ) AS attendance
-        ORDER BY eventTime;
+    # The DB stores naive PKT timestamps; pymysql escapes these as DATETIME literals
+    params = {
+        "start_time": start_time.replace(tzinfo=None, microsecond=0),
+        "end_time": end_time.replace(tzinfo=None, microsecond=0),
+    }
+
+    # Single scan of the timecard table; a punch outside the window is projected as NULL
+    query = """
+    SELECT
+        pe.emp_code AS employeeId,
+        CASE WHEN apt.clock_in >= %(start_time)s AND apt.clock_in < %(end_time)s
+            THEN apt.clock_in END AS checkIn,
+        CASE WHEN apt.clock_out >= %(start_time)s AND apt.clock_out < %(end_time)s
+            THEN apt.clock_out END AS checkOut
+    FROM zkbiotime.att_payloadtimecard apt
+    JOIN zkbiotime.personnel_employee pe ON pe.id = apt.emp_id
+    WHERE (apt.clock_in >= %(start_time)s AND apt.clock_in < %(end_time)s)
+    OR (apt.clock_out >= %(start_time)s AND apt.clock_out < %(end_time)s);
     """
 
+    connection = get_db_connection(db_host, db_user, db_password, db_name)
+    try:
+        logger.info("Executing query: %s", query)
+        # Stream rows from the server and transform them as they arrive
+        with connection.cursor(pymysql.cursors.SSDictCursor) as cursor:
+            cursor.execute(query, params)
+            zoho_data = transform_records_for_zoho(cursor)
+            logger.info("Query executed successfully, fetched %d records.", len(zoho_data))
+            return zoho_data
+    except Exception:
+        close_db_connection()
+        raise
+
+
+def get_db_connection(db_host, db_user, db_password, db_name):
+    global _db_connection
+    if _db_connection is not None:
+        try:
+            _db_connection.ping(reconnect=True)
+            logger.info("Reusing DB connection to host: %s", db_host)
+            return _db_connection
+        except Exception as e:
+            logger.info("Cached DB connection is unusable, reconnecting: %s", e)
+            close_db_connection()
+
     logger.info("Connecting to DB at host: %s", db_host)
-    connection = pymysql.connect(
-        host=db_host, port=3300, user=db_user, password=db_password, database=db_name
+    # autocommit so each invocation's SELECT sees a fresh snapshot rather than an old transaction
+    _db_connection = pymysql.connect(
+        host=db_host, port=3300, user=db_user, password=db_password, database=db_name, autocommit=True
     )
+    return _db_connection
+
+
+def close_db_connection():
+    global _db_connection
+    if _db_connection is None:
+        return
     try:
-        logger.info("Executing query: %s", query)
-        with connection.cursor(pymysql.cursors.DictCursor) as cursor:
-            cursor.execute(query)
-            records = cursor.fetchall()
-            logger.info("Query executed successfully, fetched %s.", records)
-            return records
-    finally:
-        connection.close()
-        logger.info("Closed DB connection.")
+        _db_connection.close()
+    except Exception:
+        pass
+    _db_connection = None
+    logger.info("Closed DB connection.")
 
 
 def transform_records_for_zoho(records):
-    zoho_data = []
-    for record in records:
-        if record["isCheckin"] == "1":
-            zoho_data.append({"empId": record["employeeId"], "checkIn": record["eventTime"]})
-        else:
-            zoho_data.append({"empId": record["employeeId"], "checkOut": record["eventTime"]})
+    # pymysql decodes DATETIME columns to datetime; format to match the bulkImport dateFormat
+    zoho_data = [
+        {"empId": record["employeeId"], punch: record[punch].strftime("%Y-%m-%d %H:%M:%S")}
+        for record in records
+        for punch in ("checkIn", "checkOut")
+        if record[punch] is not None
+    ]
+    # Rows arrive unordered and emit their check-in and check-out together; sort by punch time here
+    # rather than in SQL. The formatted timestamps sort chronologically and the stable sort keeps a row's
+    # in before its out.
+    zoho_data.sort(key=lambda entry: entry.get("checkIn") or entry["checkOut"])
     return zoho_data
 
 
 def get_or_refresh_zoho_access_token(refresh_token, client_id, client_secret):
+    current_time = datetime.now(timezone.utc)
+    if _token_is_valid(_TOKEN_CACHE["expiry"], current_time):
+        logger.info("Using in-memory Zoho access token. Valid until %s", _TOKEN_CACHE["expiry"].isoformat())
+        return _TOKEN_CACHE["access_token"]
+
     logger.info("Attempting to retrieve cached access token and expiry from SSM.")
     try:
-        access_token = get_ssm_parameter(ZOHO_TOKEN_SSM_KEY)
-        expiry_str = get_ssm_parameter(ZOHO_TOKEN_EXPIRY_SSM_KEY)
-        expiry_time = datetime.fromisoformat(expiry_str)
+        blob = parse_token_blob(get_ssm_parameter(ZOHO_TOKEN_SSM_KEY, decrypt=True))
+        if blob is None:
+            # Expected once per environment: the refresh rewrites the parameter as a JSON blob
+            logger.info("SSM parameter %s holds a legacy plain token; refreshing to migrate it.", ZOHO_TOKEN_SSM_KEY)
+            return refresh_zoho_access_token(refresh_token, client_id, client_secret)
+        access_token = blob["access_token"]
+        expiry_time = datetime.fromisoformat(blob["expiry"])
         logger.info("Cached access token expires at: %s", expiry_time.isoformat())
 
-        current_time = datetime.now(timezone.utc)
-        if current_time < (expiry_time - timedelta(seconds=ACCESS_TOKEN_GRACE_PERIOD)):
+        if _token_is_valid(expiry_time, current_time):
             logger.info("Using cached Zoho access token. Valid until %s", expiry_time.isoformat())
+            _TOKEN_CACHE["access_token"] = access_token
+            _TOKEN_CACHE["expiry"] = expiry_time
             return access_token
         else:
             logger.info("Cached token near expiry, refreshing now.")
@@ -164,6 +262,21 @@ def get_or_refresh_zoho_access_token(refresh_token, client_id, client_secret):
         return refresh_zoho_access_token(refresh_token, client_id, client_secret)
 
 
+def parse_token_blob(value):
+    # Before the token and expiry were stored together the parameter held the bare access token
+    try:
+        blob = json.loads(value)
+    except ValueError:
+        return None
+    return blob if isinstance(blob, dict) else None
+
+
+def _token_is_valid(expiry_time, current_time):
+    if expiry_time is None:
+        return False
+    return current_time < (expiry_time - timedelta(seconds=ACCESS_TOKEN_GRACE_PERIOD))
+
+
 def refresh_zoho_access_token(refresh_token, client_id, client_secret):
     payload = {
         "grant_type": "refresh_token",
@@ -176,7 +289,7 @@ def refresh_zoho_access_token(refresh_token, client_id, client_secret):
     #              f"'grant_type': 'refresh_token', 'client_id': '{client_id[:5]}...', "
     #              f"'client_secret': '***', 'refresh_token': '{refresh_token[:5]}...'")
 
-    response = requests.post(ZOHO_TOKEN_ENDPOINT, data=payload)
+    response = _session.post(ZOHO_TOKEN_ENDPOINT, data=payload, timeout=ZOHO_HTTP_TIMEOUT)
     logger.info("Zoho token refresh response status: %d", response.status_code)
     logger.info("Zoho token refresh response body: %s", response.text)
 
@@ -188,43 +301,139 @@ def refresh_zoho_access_token(refresh_token, client_id, client_secret):
     expiry_time = datetime.now(timezone.utc) + timedelta(seconds=tokens["expires_in"])
 
     logger.info("Storing new access token and expiry in SSM...")
-    put_ssm_parameter(ZOHO_TOKEN_SSM_KEY, access_token, param_type="SecureString")
-    put_ssm_parameter(ZOHO_TOKEN_EXPIRY_SSM_KEY, expiry_time.isoformat(), param_type="String")
+    blob = json.dumps({"access_token": access_token, "expiry": expiry_time.isoformat()})
+    put_ssm_parameter(ZOHO_TOKEN_SSM_KEY, blob, param_type="SecureString")
+
+    _TOKEN_CACHE["access_token"] = access_token
+    _TOKEN_CACHE["expiry"] = expiry_time
 
     logger.info("Access token refreshed and cached until %s", expiry_time.isoformat())
     return access_token
 
 
-def send_to_zoho(data, access_token):
+def send_to_zoho(data, access_token, context=None):
+    global _concurrency
     headers = {
         "Authorization": f"Zoho-oauthtoken {access_token}",
     }
 
+    batches = build_zoho_batches(data, ZOHO_BULK_IMPORT_BATCH_SIZE)
+    logger.info("Sending %d records to Zoho in %d batches.", len(data), len(batches))
+
+    results = []
+    consecutive_failures = 0
+    retry_after = 0
+    # Batches are independent; the GIL is released while each POST waits on the socket
+    while len(results) < len(batches):
+        # Stop before the function timeout would kill an upload mid-wave and trigger an async re-invoke
+        needed_ms = retry_after * 1000 + ZOHO_WAVE_TIME_BUDGET_MS
+        if context is not None and context.get_remaining_time_in_millis() < needed_ms:
+            logger.error("Not enough time left for another Zoho bulkImport wave.")
+            skip_remaining_batches(results, batches)
+            break
+
+        if retry_after:
+            logger.info("Zoho asked to retry after %s seconds; pausing before the next batches.", retry_after)
+            time.sleep(retry_after)
+
+        wave = batches[len(results):len(results) + _concurrency]
+        retry_after = 0
+        throttled = False
+        for result, batch_retry_after in _executor.map(lambda batch: send_batch_to_zoho(batch, headers), wave):
+            results.append(result)
+            if is_retryable_failure(result["status_code"]):
+                throttled = True
+                consecutive_failures += 1
+                retry_after = max(retry_after, batch_retry_after)
+            else:
+                consecutive_failures = 0
+
+        # Multiplicative decrease on throttling or server errors, additive increase otherwise
+        if throttled:
+            _concurrency = max(1, _concurrency // 2)
+        else:
+            _concurrency = min(ZOHO_BULK_IMPORT_MAX_WORKERS, _concurrency + 1)
+        logger.info("Zoho bulkImport concurrency is now %d.", _concurrency)
+
+        if consecutive_failures >= ZOHO_CIRCUIT_BREAKER_THRESHOLD:
+            logger.error("Circuit breaker open after %d consecutive failed batches.", consecutive_failures)
+            skip_remaining_batches(results, batches)
+            break
+
+    return results
+
+
+def skip_remaining_batches(results, batches):
+    skipped = len(batches) - len(results)
+    logger.error("Skipping %d remaining Zoho bulkImport batches.", skipped)
+    results.extend({"status_code": None, "response_body": None, "skipped": True} for _ in range(skipped))
+
+
+def build_zoho_batches(data, batch_size):
+    # Batches are sent concurrently, so keep each employee's punches together in one batch
+    # (in their original order) so a checkOut can never race ahead of its checkIn.
+    # An employee with more than batch_size punches gets a single oversized batch.
+    batch_of = {}
+    sizes = []
+    for emp_id, count in Counter(entry["empId"] for entry in data).items():
+        if not sizes or (sizes[-1] and sizes[-1] + count > batch_size):
+            sizes.append(0)
+        batch_of[emp_id] = len(sizes) - 1
+        sizes[-1] += count
+
+    batches = [[] for _ in sizes]
+    for entry in data:
+        batches[batch_of[entry["empId"]]].append(entry)
+    return batches
+
+
+def send_batch_to_zoho(batch, headers):
     payload = {
-        "data": json.dumps(data),
+        "data": json.dumps(batch, separators=(",", ":"), ensure_ascii=False),
         "dateFormat": "yyyy-MM-dd HH:mm:ss"
     }
 
-    logger.info("Sending POST to Zoho bulkImport endpoint with form-data payload: %s", payload)
+    logger.info("Sending POST to Zoho bulkImport endpoint with %d records.", len(batch))
+    logger.debug("Zoho bulkImport form-data payload: %s", payload)
 
     try:
-        response = requests.post(ZOHO_BULK_IMPORT_ENDPOINT, headers=headers, data=payload)
+        response = _session.post(ZOHO_BULK_IMPORT_ENDPOINT, headers=headers, data=payload, timeout=ZOHO_HTTP_TIMEOUT)
 
         logger.info("Zoho bulkImport response status: %d", response.status_code)
-        logger.info("Zoho bulkImport response body: %s", response.text)
+        logger.info("Zoho bulkImport response length: %d", len(response.text))
+        logger.debug("Zoho bulkImport response body: %s", response.text)
 
-        return {
+        result = {
             "status_code": response.status_code,
             "response_body": response.text
         }
+        return result, parse_retry_after(response.headers.get("Retry-After"))
     except Exception as e:
         logger.error("Error while sending data to Zoho: %s", str(e))
-        raise Exception(f"Failed to send data to Zoho: {str(e)}")
+        return {"status_code": None, "response_body": f"Failed to send data to Zoho: {str(e)}"}, 0
+
 
+def is_successful_status(status_code):
+    # Skipped batches and transport errors carry no status code
+    return status_code is not None and 200 <= status_code < 300
 
-def get_ssm_parameter(name):
+
+def is_retryable_failure(status_code):
+    # Only throttling, server and transport errors drive AIMD and the breaker; other 4xx are reported, not retried
+    return status_code is None or status_code == 429 or status_code >= 500
+
+
+def parse_retry_after(value):
+    # Only the delay-seconds form is honoured, capped to fit the function timeout
+    try:
+        return min(max(float(value), 0), ZOHO_MAX_RETRY_AFTER)
+    except (TypeError, ValueError):
+        return 0
+
+
+def get_ssm_parameter(name, decrypt=False):
     logger.info("Retrieving SSM parameter: %s", name)
-    value = ssm.get_parameter(Name=name, WithDecryption=True)["Parameter"]["Value"]
+    value = ssm.get_parameter(Name=name, WithDecryption=decrypt)["Parameter"]["Value"]
     logger.info("Retrieved SSM parameter: %s = %s", name, value[:10] + "..." if len(value) > 10 else value)
     return value
 
@@ -239,16 +448,21 @@ def success_response(message, data=None):
     body = {"message": message}
     if data is not None:
         body["data"] = data
-    logger.info("Returning success response: %s", json.dumps(body))
+    body_json = json.dumps(body)
+    logger.info("Returning success response: %s", message)
+    logger.debug("Success response body: %s", body_json)
     return {
         "statusCode": 200,
-        "body": json.dumps(body)
+        "body": body_json
     }
 
 
-def error_response(message):
+def error_response(message, data=None):
+    body = {"error": message}
+    if data is not None:
+        body["data"] = data
     logger.info("Returning error response: %s", message)
     return {
         "statusCode": 500,
-        "body": json.dumps({"error": message})
+        "body": json.dumps(body)
     }
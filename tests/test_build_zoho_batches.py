@@ -0,0 +1,22 @@
+from sync import app
+
+
+def test_employee_punches_stay_in_one_batch_in_order():
+    data = [
+        {"empId": "A", "checkIn": "09:00"},
+        {"empId": "B", "checkIn": "10:00"},
+        {"empId": "A", "checkOut": "17:00"},
+        {"empId": "C", "checkIn": "11:00"},
+        {"empId": "B", "checkOut": "18:00"},
+    ]
+
+    assert app.build_zoho_batches(data, 3) == [
+        [{"empId": "A", "checkIn": "09:00"}, {"empId": "A", "checkOut": "17:00"}],
+        [{"empId": "B", "checkIn": "10:00"}, {"empId": "C", "checkIn": "11:00"}, {"empId": "B", "checkOut": "18:00"}],
+    ]
+
+
+def test_employee_larger_than_batch_size_is_not_split():
+    data = [{"empId": "A", "checkIn": str(i)} for i in range(3)] + [{"empId": "B", "checkIn": "x"}]
+
+    assert [len(batch) for batch in app.build_zoho_batches(data, 2)] == [3, 1]
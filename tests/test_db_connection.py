@@ -0,0 +1,107 @@
+from datetime import datetime
+
+import pymysql
+import pytest
+
+from sync import app
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, query, params):
+        if self.connection.query_error:
+            raise self.connection.query_error
+
+    def __iter__(self):
+        return iter(self.connection.rows)
+
+
+class FakeConnection:
+    def __init__(self):
+        self.ping_error = None
+        self.query_error = None
+        self.rows = []
+        self.pings = 0
+        self.closed = False
+
+    def ping(self, reconnect=False):
+        self.pings += 1
+        if self.ping_error:
+            raise self.ping_error
+
+    def cursor(self, cursor_class):
+        return FakeCursor(self)
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    """Stub pymysql.connect; each call hands out a new FakeConnection."""
+    opened = []
+
+    def connect(**kwargs):
+        assert kwargs["autocommit"] is True
+        opened.append(FakeConnection())
+        return opened[-1]
+
+    monkeypatch.setattr(app.pymysql, "connect", connect)
+    monkeypatch.setattr(app, "_db_connection", None)
+    return opened
+
+
+def get_connection():
+    return app.get_db_connection("host", "user", "password", "db")
+
+
+def test_connection_is_reused_across_calls(connections):
+    first = get_connection()
+    second = get_connection()
+
+    assert first is second
+    assert len(connections) == 1
+    assert first.pings == 1
+
+
+def test_failing_ping_reconnects(connections):
+    stale = get_connection()
+    stale.ping_error = pymysql.err.OperationalError(2013, "Lost connection")
+
+    fresh = get_connection()
+
+    assert fresh is not stale
+    assert stale.closed
+    assert len(connections) == 2
+    assert app._db_connection is fresh
+
+
+def test_query_error_drops_the_connection(connections):
+    get_connection().query_error = pymysql.err.OperationalError(2013, "Lost connection")
+
+    with pytest.raises(pymysql.err.OperationalError):
+        app.fetch_attendance_records("host", "user", "password", "db")
+
+    assert connections[0].closed
+    assert app._db_connection is None
+    assert get_connection() is connections[1]
+
+
+def test_fetch_keeps_the_connection_open(connections):
+    get_connection().rows = [
+        {"employeeId": "A", "checkIn": datetime(2024, 1, 1, 9), "checkOut": None},
+    ]
+
+    assert app.fetch_attendance_records("host", "user", "password", "db") == [
+        {"empId": "A", "checkIn": "2024-01-01 09:00:00"},
+    ]
+    assert not connections[0].closed
+    assert app._db_connection is connections[0]
@@ -0,0 +1,207 @@
+import json
+
+import pytest
+import requests
+
+from sync import app
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.text = "{}"
+        self.headers = headers or {}
+
+
+@pytest.fixture
+def zoho(monkeypatch):
+    """Stub bulkImport POSTs; outcomes are keyed by empId so concurrent waves stay deterministic."""
+    outcomes = {}
+    sleeps = []
+
+    def post(url, headers=None, data=None, timeout=None):
+        assert timeout == app.ZOHO_HTTP_TIMEOUT
+        emp_id = json.loads(data["data"])[0]["empId"]
+        outcome = outcomes.get(emp_id, 200)
+        if isinstance(outcome, Exception):
+            raise outcome
+        if isinstance(outcome, FakeResponse):
+            return outcome
+        return FakeResponse(outcome)
+
+    monkeypatch.setattr(app._session, "post", post)
+    monkeypatch.setattr(app.time, "sleep", sleeps.append)
+    # One employee per batch so each outcome maps to exactly one batch
+    monkeypatch.setattr(app, "ZOHO_BULK_IMPORT_BATCH_SIZE", 1)
+    monkeypatch.setattr(app, "_concurrency", app.ZOHO_BULK_IMPORT_INITIAL_CONCURRENCY)
+    return outcomes, sleeps
+
+
+def make_data(count):
+    return [{"empId": f"E{i}", "checkIn": "2024-01-01 09:00:00"} for i in range(count)]
+
+
+def statuses(results):
+    return [result["status_code"] for result in results]
+
+
+def test_concurrency_increases_additively_on_success(zoho, monkeypatch):
+    monkeypatch.setattr(app, "_concurrency", 2)
+
+    results = app.send_to_zoho(make_data(5), "token")
+
+    # Waves of 2 then 3 batches, each adding one
+    assert statuses(results) == [200] * 5
+    assert app._concurrency == 4
+
+
+def test_concurrency_is_capped_at_max_workers(zoho, monkeypatch):
+    monkeypatch.setattr(app, "_concurrency", app.ZOHO_BULK_IMPORT_MAX_WORKERS)
+
+    app.send_to_zoho(make_data(3), "token")
+
+    assert app._concurrency == app.ZOHO_BULK_IMPORT_MAX_WORKERS
+
+
+def test_concurrency_halves_on_throttling(zoho, monkeypatch):
+    outcomes, _ = zoho
+    outcomes["E0"] = 429
+    monkeypatch.setattr(app, "_concurrency", 4)
+
+    results = app.send_to_zoho(make_data(4), "token")
+
+    assert statuses(results) == [429, 200, 200, 200]
+    assert app._concurrency == 2
+
+
+def test_circuit_breaker_skips_remaining_batches(zoho, monkeypatch):
+    outcomes, _ = zoho
+    outcomes.update({f"E{i}": 500 for i in range(6)})
+    monkeypatch.setattr(app, "_concurrency", 2)
+
+    results = app.send_to_zoho(make_data(6), "token")
+
+    # Wave of 2 fails and halves concurrency to 1; the next failure trips the breaker
+    assert statuses(results) == [500, 500, 500, None, None, None]
+    assert [bool(result.get("skipped")) for result in results] == [False] * 3 + [True] * 3
+    assert app._concurrency == 1
+
+
+def test_retry_after_is_capped(zoho, monkeypatch):
+    outcomes, sleeps = zoho
+    outcomes["E0"] = FakeResponse(429, {"Retry-After": "60"})
+    monkeypatch.setattr(app, "_concurrency", 1)
+
+    app.send_to_zoho(make_data(2), "token")
+
+    assert sleeps == [app.ZOHO_MAX_RETRY_AFTER]
+
+
+def test_retry_after_only_honours_delay_seconds():
+    assert app.parse_retry_after("2") == 2
+    assert app.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+    assert app.parse_retry_after(None) == 0
+
+
+def test_transport_error_is_recorded_as_failed_batch(zoho):
+    outcomes, _ = zoho
+    outcomes["E0"] = requests.ConnectionError("connection reset")
+
+    results = app.send_to_zoho(make_data(1), "token")
+
+    assert statuses(results) == [None]
+    assert "connection reset" in results[0]["response_body"]
+
+
+@pytest.fixture
+def handler(zoho, monkeypatch):
+    def run(record_count):
+        monkeypatch.setattr(app, "fetch_attendance_records", lambda *args: make_data(record_count))
+        monkeypatch.setattr(app, "get_or_refresh_zoho_access_token", lambda *args: "token1234567890")
+        return app.lambda_handler({}, None)
+
+    return run
+
+
+def test_handler_reports_success(handler):
+    response = handler(3)
+
+    assert response["statusCode"] == 200
+    assert json.loads(response["body"])["message"] == "Data sent to Zoho successfully"
+
+
+def test_handler_reports_error_when_all_batches_fail(handler, zoho):
+    outcomes, _ = zoho
+    outcomes.update({f"E{i}": 500 for i in range(3)})
+
+    response = handler(3)
+
+    assert response["statusCode"] == 500
+    assert json.loads(response["body"])["error"] == "Failed to send data to Zoho"
+
+
+def test_handler_reports_error_on_transport_failure(handler, zoho):
+    outcomes, _ = zoho
+    outcomes["E0"] = requests.ConnectionError("connection reset")
+
+    response = handler(1)
+
+    assert response["statusCode"] == 500
+    assert json.loads(response["body"])["error"] == "Failed to send data to Zoho"
+
+
+def test_handler_reports_partial_failure(handler, zoho):
+    outcomes, _ = zoho
+    outcomes["E1"] = 503
+
+    response = handler(3)
+
+    assert response["statusCode"] == 500
+    body = json.loads(response["body"])
+    assert body["error"] == "Data partially sent to Zoho: 1 of 3 batches failed"
+    assert statuses(body["data"]) == [200, 503, 200]
+
+
+class FakeContext:
+    """Lambda context whose clock only advances while send_to_zoho sleeps."""
+
+    def __init__(self, sleeps, timeout_ms=15000):
+        self.sleeps = sleeps
+        self.timeout_ms = timeout_ms
+
+    def get_remaining_time_in_millis(self):
+        return self.timeout_ms - sum(self.sleeps) * 1000
+
+
+def test_alternating_throttling_stops_within_the_time_budget(zoho):
+    outcomes, sleeps = zoho
+    for i in range(0, 20, 2):
+        outcomes[f"E{i}"] = FakeResponse(429, {"Retry-After": "5"})
+
+    results = app.send_to_zoho(make_data(20), "token", FakeContext(sleeps))
+
+    # Successes keep resetting the breaker, so only the time budget ends the run
+    assert sum(sleeps) * 1000 + app.ZOHO_WAVE_TIME_BUDGET_MS <= 15000
+    assert results[-1].get("skipped")
+    assert len(results) == 20
+
+
+def test_no_wave_starts_without_time_for_it(zoho):
+    _, sleeps = zoho
+
+    results = app.send_to_zoho(make_data(2), "token", FakeContext(sleeps, timeout_ms=1000))
+
+    assert all(result.get("skipped") for result in results)
+
+
+@pytest.mark.parametrize("status_code", [400, 401])
+def test_handler_reports_error_when_all_batches_are_rejected(handler, zoho, status_code):
+    outcomes, _ = zoho
+    outcomes.update({f"E{i}": status_code for i in range(3)})
+
+    response = handler(3)
+
+    assert response["statusCode"] == 500
+    assert json.loads(response["body"])["error"] == "Failed to send data to Zoho"
+    # Client errors are not congestion, so they don't shrink the concurrency window
+    assert app._concurrency == app.ZOHO_BULK_IMPORT_INITIAL_CONCURRENCY + 1
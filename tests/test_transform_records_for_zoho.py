@@ -0,0 +1,18 @@
+from datetime import datetime
+
+from sync import app
+
+
+def test_punches_are_sorted_by_time_across_rows():
+    records = [
+        {"employeeId": "A", "checkIn": datetime(2024, 1, 1, 9), "checkOut": datetime(2024, 1, 1, 18)},
+        {"employeeId": "B", "checkIn": datetime(2024, 1, 1, 10), "checkOut": None},
+        {"employeeId": "C", "checkIn": None, "checkOut": datetime(2024, 1, 1, 8)},
+    ]
+
+    assert app.transform_records_for_zoho(records) == [
+        {"empId": "C", "checkOut": "2024-01-01 08:00:00"},
+        {"empId": "A", "checkIn": "2024-01-01 09:00:00"},
+        {"empId": "B", "checkIn": "2024-01-01 10:00:00"},
+        {"empId": "A", "checkOut": "2024-01-01 18:00:00"},
+    ]
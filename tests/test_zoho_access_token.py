@@ -0,0 +1,129 @@
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from sync import app
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self.text = json.dumps(payload)
+        self._payload = payload
+
+    def json(self):
+        return self._payload
+
+
+@pytest.fixture
+def ssm_store(monkeypatch):
+    """In-memory SSM plus a stubbed token endpoint that always issues "new-token"."""
+    store = {}
+    calls = {"get": 0, "refresh": 0}
+
+    def get_ssm_parameter(name, decrypt=False):
+        calls["get"] += 1
+        if name not in store:
+            raise app.ssm.exceptions.ParameterNotFound(
+                {"Error": {"Code": "ParameterNotFound", "Message": name}}, "GetParameter"
+            )
+        return store[name]
+
+    def put_ssm_parameter(name, value, param_type="String"):
+        store[name] = value
+
+    def post(url, data=None, timeout=None):
+        calls["refresh"] += 1
+        return FakeResponse(200, {"access_token": "new-token", "expires_in": 3600})
+
+    monkeypatch.setattr(app, "get_ssm_parameter", get_ssm_parameter)
+    monkeypatch.setattr(app, "put_ssm_parameter", put_ssm_parameter)
+    monkeypatch.setattr(app._session, "post", post)
+    monkeypatch.setitem(app._TOKEN_CACHE, "access_token", None)
+    monkeypatch.setitem(app._TOKEN_CACHE, "expiry", None)
+    return store, calls
+
+
+def get_token():
+    return app.get_or_refresh_zoho_access_token("refresh", "client", "secret")
+
+
+def test_legacy_plain_token_is_migrated_to_json_blob(ssm_store, caplog):
+    store, calls = ssm_store
+    store[app.ZOHO_TOKEN_SSM_KEY] = "1000.abcdef0123456789.legacy"
+
+    with caplog.at_level(logging.INFO):
+        assert get_token() == "new-token"
+
+    assert calls["refresh"] == 1
+    blob = json.loads(store[app.ZOHO_TOKEN_SSM_KEY])
+    assert blob["access_token"] == "new-token"
+    assert datetime.fromisoformat(blob["expiry"]) > datetime.now(timezone.utc)
+    assert "legacy plain token" in caplog.text
+    assert not [record for record in caplog.records if record.levelno >= logging.ERROR]
+
+
+@pytest.mark.parametrize("value", ["1000.abc", "1000.5", '"quoted"'])
+def test_parse_token_blob_rejects_legacy_values(value):
+    assert app.parse_token_blob(value) is None
+
+
+def store_blob(store, access_token, expiry):
+    store[app.ZOHO_TOKEN_SSM_KEY] = json.dumps({"access_token": access_token, "expiry": expiry.isoformat()})
+
+
+def test_token_is_valid_honours_grace_period():
+    now = datetime.now(timezone.utc)
+    grace = timedelta(seconds=app.ACCESS_TOKEN_GRACE_PERIOD)
+
+    assert not app._token_is_valid(None, now)
+    assert app._token_is_valid(now + grace + timedelta(seconds=1), now)
+    assert not app._token_is_valid(now + grace, now)
+    assert not app._token_is_valid(now - timedelta(seconds=1), now)
+
+
+def test_in_memory_cache_skips_ssm(ssm_store, monkeypatch):
+    _, calls = ssm_store
+    monkeypatch.setitem(app._TOKEN_CACHE, "access_token", "memory-token")
+    monkeypatch.setitem(app._TOKEN_CACHE, "expiry", datetime.now(timezone.utc) + timedelta(hours=1))
+
+    assert get_token() == "memory-token"
+    assert calls == {"get": 0, "refresh": 0}
+
+
+def test_ssm_token_fills_the_cache(ssm_store):
+    store, calls = ssm_store
+    expiry = datetime.now(timezone.utc) + timedelta(hours=1)
+    store_blob(store, "ssm-token", expiry)
+
+    assert get_token() == "ssm-token"
+    assert get_token() == "ssm-token"
+
+    assert calls == {"get": 1, "refresh": 0}
+    assert app._TOKEN_CACHE == {"access_token": "ssm-token", "expiry": expiry}
+
+
+def test_near_expiry_cache_falls_back_to_ssm_then_refreshes(ssm_store, monkeypatch):
+    store, calls = ssm_store
+    near_expiry = datetime.now(timezone.utc) + timedelta(seconds=60)
+    monkeypatch.setitem(app._TOKEN_CACHE, "access_token", "stale-token")
+    monkeypatch.setitem(app._TOKEN_CACHE, "expiry", near_expiry)
+    store_blob(store, "stale-token", near_expiry)
+
+    assert get_token() == "new-token"
+
+    assert calls == {"get": 1, "refresh": 1}
+    assert app._TOKEN_CACHE["access_token"] == "new-token"
+    assert app._TOKEN_CACHE["expiry"] > near_expiry
+
+
+def test_missing_parameter_refreshes_and_fills_the_cache(ssm_store):
+    store, calls = ssm_store
+
+    assert get_token() == "new-token"
+    assert get_token() == "new-token"
+
+    assert calls == {"get": 1, "refresh": 1}
+    assert json.loads(store[app.ZOHO_TOKEN_SSM_KEY])["access_token"] == "new-token"